@@ -0,0 +1,207 @@
+from decimal import Decimal, InvalidOperation
+
+from lxml import etree
+
+# Importaciones con manejo de errores
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("⚠️ NumPy no disponible")
+    print("💡 Instala con: pip install numpy")
+
+
+CFDI_NS = "{http://www.sat.gob.mx/cfd/4}"
+IMPLOCAL_NS = "{http://www.sat.gob.mx/implocal}"
+
+# Los importes se manejan en punto fijo con 6 decimales (el máximo que
+# permite el anexo 20 para ValorUnitario/TasaOCuota) para evitar errores de
+# redondeo de float al sumar miles de conceptos.
+ESCALA = 10 ** 6
+
+# Valor absoluto máximo de un importe en unidades de punto fijo. Se deja
+# margen bajo 2**63 para que las sumas de hasta 16 términos (Total calculado,
+# diferencias) no desborden int64; equivale a ~576 mil millones de pesos.
+LIMITE_UNIDADES = 2 ** 63 // 16
+
+# Diferencia máxima aceptada por redondeo, en unidades de la moneda
+TOLERANCIA_DEFAULT = "0.01"
+
+
+def _en_rango(unidades, valor):
+    if abs(unidades) >= LIMITE_UNIDADES:
+        raise ValueError(f"Importe fuera de rango: {valor!r}")
+    return unidades
+
+
+def _a_unidades(valor):
+    """Convierte un importe del XML ("1295299.20") a entero en punto fijo"""
+    if valor is None or valor == "":
+        return 0
+    try:
+        decimal = Decimal(valor)
+        if not decimal.is_finite():
+            raise ValueError(valor)
+        unidades = int((decimal * ESCALA).to_integral_value())
+    except (InvalidOperation, ValueError, OverflowError):
+        raise ValueError(f"Importe no numérico: {valor!r}")
+    return _en_rango(unidades, valor)
+
+
+def _sumar_importes(elementos):
+    suma = sum(_a_unidades(e.get("Importe")) for e in elementos)
+    return _en_rango(suma, f"suma de Importe = {suma / ESCALA}")
+
+
+def _extraer_documento(root):
+    """
+    Extrae los importes de un Comprobante.
+
+    Retorna (totales, conceptos) donde totales es la fila del documento y
+    conceptos es una lista de filas [Importe, Descuento, Traslados, Retenciones].
+    Lanza ValueError si el documento no es CFDI 4.0 o tiene importes inválidos.
+    """
+    if root.tag != f"{CFDI_NS}Comprobante":
+        raise ValueError(f"Versión de CFDI no soportada: {root.tag}")
+
+    impuestos = root.find(f"{CFDI_NS}Impuestos")
+    if impuestos is not None:
+        total_trasladados = _a_unidades(impuestos.get("TotalImpuestosTrasladados"))
+        total_retenidos = _a_unidades(impuestos.get("TotalImpuestosRetenidos"))
+        suma_traslados = _sumar_importes(
+            impuestos.iterfind(f"{CFDI_NS}Traslados/{CFDI_NS}Traslado"))
+        suma_retenciones = _sumar_importes(
+            impuestos.iterfind(f"{CFDI_NS}Retenciones/{CFDI_NS}Retencion"))
+    else:
+        total_trasladados = total_retenidos = 0
+        suma_traslados = suma_retenciones = 0
+
+    # Complemento de impuestos locales: sus totales forman parte del Total
+    locales_trasladados = locales_retenidos = 0
+    for locales in root.iterfind(f"{CFDI_NS}Complemento/{IMPLOCAL_NS}ImpuestosLocales"):
+        locales_trasladados += _a_unidades(locales.get("TotaldeTraslados"))
+        locales_retenidos += _a_unidades(locales.get("TotaldeRetenciones"))
+
+    totales = [
+        _a_unidades(root.get("SubTotal")),
+        _a_unidades(root.get("Descuento")),
+        _a_unidades(root.get("Total")),
+        total_trasladados,
+        total_retenidos,
+        suma_traslados,
+        suma_retenciones,
+        _en_rango(locales_trasladados, "TotaldeTraslados"),
+        _en_rango(locales_retenidos, "TotaldeRetenciones"),
+    ]
+
+    conceptos = []
+    for concepto in root.iterfind(f"{CFDI_NS}Conceptos/{CFDI_NS}Concepto"):
+        conceptos.append([
+            _a_unidades(concepto.get("Importe")),
+            _a_unidades(concepto.get("Descuento")),
+            _sumar_importes(concepto.iterfind(
+                f"{CFDI_NS}Impuestos/{CFDI_NS}Traslados/{CFDI_NS}Traslado")),
+            _sumar_importes(concepto.iterfind(
+                f"{CFDI_NS}Impuestos/{CFDI_NS}Retenciones/{CFDI_NS}Retencion")),
+        ])
+
+    # Las sumas por documento se hacen en int64; validar que no desborden
+    for columna in zip(*conceptos):
+        _en_rango(sum(columna), "suma de conceptos")
+
+    return totales, conceptos
+
+
+def verificar_totales_lote(documentos, tolerancia=TOLERANCIA_DEFAULT):
+    """
+    Verifica la aritmética de un lote de Comprobantes antes de sellarlos.
+
+    Recibe árboles o elementos raíz ya parseados y revisa, con reducciones
+    vectorizadas sobre arreglos int64 (una fila por concepto con el índice de
+    su documento):
+      - SubTotal contra la suma de Concepto/@Importe
+      - Descuento contra la suma de Concepto/@Descuento
+      - TotalImpuestosTrasladados/Retenidos contra sus Traslado/Retencion
+      - Traslados de los conceptos contra TotalImpuestosTrasladados
+        (con una tolerancia de redondeo por concepto)
+      - Total contra SubTotal - Descuento + Trasladados - Retenidos
+        (incluyendo el complemento implocal:ImpuestosLocales)
+
+    Retorna una lista de (indice, errores) solo con los documentos que fallan,
+    Los documentos que no son CFDI 4.0 o con importes no numéricos o fuera de
+    rango se reportan como fallidos. Retorna None si NumPy no está disponible.
+    """
+    if not NUMPY_AVAILABLE:
+        print("❌ NumPy no disponible, no se pueden verificar los totales del lote")
+        return None
+
+    tol = _a_unidades(tolerancia)
+    fallidos = {}
+    filas_documento = []
+    filas_concepto = []
+    indices_concepto = []
+
+    for indice, documento in enumerate(documentos):
+        root = documento.getroot() if isinstance(documento, etree._ElementTree) else documento
+        try:
+            totales, conceptos = _extraer_documento(root)
+        except ValueError as e:
+            fallidos[indice] = [str(e)]
+            totales, conceptos = [0] * 9, []
+        filas_documento.append(totales)
+        filas_concepto.extend(conceptos)
+        indices_concepto.extend([indice] * len(conceptos))
+
+    num_docs = len(filas_documento)
+    if num_docs == 0:
+        return []
+
+    docs = np.array(filas_documento, dtype=np.int64).reshape(num_docs, 9)
+    conceptos = np.array(filas_concepto, dtype=np.int64).reshape(-1, 4)
+    idx = np.array(indices_concepto, dtype=np.int64)
+
+    # Suma por documento de cada columna de conceptos (exacta en int64)
+    sumas = np.zeros((num_docs, 4), dtype=np.int64)
+    np.add.at(sumas, idx, conceptos)
+    num_conceptos = np.bincount(idx, minlength=num_docs).astype(np.int64)
+
+    subtotal, descuento, total = docs[:, 0], docs[:, 1], docs[:, 2]
+    total_trasladados, total_retenidos = docs[:, 3], docs[:, 4]
+    suma_traslados, suma_retenciones = docs[:, 5], docs[:, 6]
+    locales_trasladados, locales_retenidos = docs[:, 7], docs[:, 8]
+
+    total_calculado = (subtotal - descuento + total_trasladados - total_retenidos
+                       + locales_trasladados - locales_retenidos)
+
+    # (mensaje, valor declarado, valor calculado, tolerancia por documento)
+    reglas = [
+        ("SubTotal no coincide con la suma de Importe de los conceptos",
+         subtotal, sumas[:, 0], tol),
+        ("Descuento no coincide con la suma de Descuento de los conceptos",
+         descuento, sumas[:, 1], tol),
+        ("TotalImpuestosTrasladados no coincide con la suma de Traslados",
+         total_trasladados, suma_traslados, tol),
+        ("TotalImpuestosRetenidos no coincide con la suma de Retenciones",
+         total_retenidos, suma_retenciones, tol),
+        ("Traslados de los conceptos no coinciden con TotalImpuestosTrasladados",
+         total_trasladados, sumas[:, 2], tol * np.maximum(num_conceptos, 1)),
+        ("Retenciones de los conceptos no coinciden con TotalImpuestosRetenidos",
+         total_retenidos, sumas[:, 3], tol * np.maximum(num_conceptos, 1)),
+        ("Total no coincide con SubTotal - Descuento + Impuestos",
+         total, total_calculado, tol),
+    ]
+
+    # Los documentos que no se pudieron leer ya están reportados
+    ilegibles = np.zeros(num_docs, dtype=bool)
+    ilegibles[list(fallidos)] = True
+
+    for mensaje, declarado, calculado, limite in reglas:
+        errores = (np.abs(declarado - calculado) > limite) & ~ilegibles
+        for indice in np.flatnonzero(errores):
+            indice = int(indice)
+            fallidos.setdefault(indice, []).append(
+                f"{mensaje}: declarado {declarado[indice] / ESCALA:.6f}, "
+                f"calculado {calculado[indice] / ESCALA:.6f}")
+
+    return sorted(fallidos.items())
@@ -0,0 +1,245 @@
+"""
+Keystore de CSDs en un solo archivo indexado y mapeado en memoria.
+
+Sustituye el árbol cert_folder/<RFC>/{RFC}.cer|.key|contraseña.txt por un
+bundle con todos los emisores, para evitar tres aperturas de archivo (y una
+búsqueda de directorio en sistemas de archivos de red) por cada sellado.
+
+Formato del bundle (enteros little-endian):
+    cabecera:  MAGIC (4) | versión u16 | número de emisores u32 | offset índice u64
+    datos:     certificado, llave y contraseña de cada emisor, uno tras otro
+    índice:    una entrada de tamaño fijo por emisor, ordenada por RFC:
+               RFC (16, utf-8 con relleno NUL) | (offset u64, longitud u32) x3
+
+Uso:
+    python keystore_csd.py construir <cert_folder> <bundle>
+    python keystore_csd.py actualizar <cert_folder> <bundle>
+    python keystore_csd.py listar <bundle>
+
+    with XMLProcessor(keystore="<bundle>") as processor:
+        processor.sellar_xml(xml_path)
+"""
+import argparse
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from pathlib import Path
+
+MAGIC = b"CSDK"
+VERSION = 1
+CABECERA = struct.Struct("<4sHIQ")
+ENTRADA = struct.Struct("<16sQIQIQI")
+PASSWORD_FILE = "contraseña.txt"
+
+
+class KeystoreCSD:
+    """
+    Lector de un bundle de CSDs; las búsquedas por RFC son O(1).
+
+    Si `obtener` no encuentra un RFC y el bundle fue reemplazado en disco
+    (por ejemplo con `actualizar`), se vuelve a mapear el archivo nuevo, así
+    los emisores agregados se ven sin reiniciar el proceso.
+    """
+
+    def __init__(self, bundle_path):
+        self.bundle_path = Path(bundle_path)
+        self._lock = threading.Lock()
+        self._file, self._mm, self._indice, self._firma = self._abrir()
+
+    def _abrir(self):
+        """Abre y mapea el bundle; retorna (file, mmap, indice, firma del archivo)"""
+        archivo = open(self.bundle_path, "rb")
+        mm = None
+        try:
+            info = os.fstat(archivo.fileno())
+            mm = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+            indice = self._leer_indice(mm)
+        except Exception:
+            if mm is not None:
+                mm.close()
+            archivo.close()
+            raise
+        return archivo, mm, indice, (info.st_ino, info.st_mtime_ns, info.st_size)
+
+    def _leer_indice(self, mm):
+        if len(mm) < CABECERA.size:
+            raise ValueError(f"Bundle de CSDs inválido: {self.bundle_path}")
+        magic, version, total, offset_indice = CABECERA.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Bundle de CSDs inválido: {self.bundle_path}")
+        if offset_indice + total * ENTRADA.size > len(mm):
+            raise ValueError(f"Bundle de CSDs truncado: {self.bundle_path}")
+
+        indice = {}
+        for i in range(total):
+            rfc, *ubicaciones = ENTRADA.unpack_from(
+                mm, offset_indice + i * ENTRADA.size)
+            # Los datos de cada emisor deben estar completos antes del índice
+            for offset, longitud in zip(ubicaciones[::2], ubicaciones[1::2]):
+                if offset < CABECERA.size or offset + longitud > offset_indice:
+                    raise ValueError(f"Bundle de CSDs truncado: {self.bundle_path}")
+            indice[rfc.rstrip(b"\0").decode("utf-8")] = tuple(ubicaciones)
+        return indice
+
+    def _recargar_si_cambio(self):
+        """Vuelve a mapear el bundle si el archivo en disco ya no es el mapeado"""
+        try:
+            info = os.stat(self.bundle_path)
+        except OSError:
+            return False
+        if (info.st_ino, info.st_mtime_ns, info.st_size) == self._firma:
+            return False
+
+        anterior = (self._file, self._mm)
+        self._file, self._mm, self._indice, self._firma = self._abrir()
+        anterior[1].close()
+        anterior[0].close()
+        print(f"🔄 Bundle de CSDs recargado: {self.bundle_path} ({len(self._indice)} emisores)")
+        return True
+
+    def _leer(self, offset, longitud):
+        return self._mm[offset:offset + longitud]
+
+    def __contains__(self, rfc):
+        return rfc in self._indice
+
+    def __len__(self):
+        return len(self._indice)
+
+    def rfcs(self):
+        return sorted(self._indice)
+
+    def obtener(self, rfc):
+        """Retorna (cer_bytes, key_bytes, password) o None si el RFC no existe"""
+        with self._lock:
+            ubicacion = self._indice.get(rfc)
+            if ubicacion is None:
+                try:
+                    if self._recargar_si_cambio():
+                        ubicacion = self._indice.get(rfc)
+                except (OSError, ValueError) as e:
+                    # Se sigue usando el bundle ya mapeado
+                    print(f"⚠️ No se pudo recargar el bundle de CSDs: {e}")
+            if ubicacion is None:
+                return None
+            cer_off, cer_len, key_off, key_len, pass_off, pass_len = ubicacion
+            return (self._leer(cer_off, cer_len),
+                    self._leer(key_off, key_len),
+                    self._leer(pass_off, pass_len).decode("utf-8"))
+
+    def cerrar(self):
+        with self._lock:
+            self._mm.close()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+def leer_emisores_de_carpeta(cert_folder):
+    """Lee el árbol cert_folder/<RFC>/ y retorna {rfc: (cer, key, password)}"""
+    emisores = {}
+    for emisor_folder in sorted(Path(cert_folder).iterdir()):
+        if not emisor_folder.is_dir():
+            continue
+        rfc = emisor_folder.name
+        cer_path = emisor_folder / f"{rfc}.cer"
+        key_path = emisor_folder / f"{rfc}.key"
+        pass_path = emisor_folder / PASSWORD_FILE
+        if not cer_path.exists() or not key_path.exists() or not pass_path.exists():
+            print(f"⚠️ Archivos de certificados faltantes para {rfc}, se omite")
+            continue
+
+        with open(pass_path, 'r', encoding='utf-8') as f:
+            password = f.read().rstrip('\r\n')  # Igual que sellar_xml
+        emisores[rfc] = (cer_path.read_bytes(), key_path.read_bytes(), password)
+    return emisores
+
+
+def escribir_bundle(emisores, bundle_path):
+    """
+    Escribe {rfc: (cer, key, password)} en un bundle nuevo.
+
+    Se escribe a un temporal y se reemplaza con os.replace para que los
+    procesos que tengan el bundle anterior mapeado sigan leyendo datos válidos.
+    """
+    bundle_path = Path(bundle_path)
+    fd, temp_path = tempfile.mkstemp(dir=bundle_path.parent,
+                                     prefix=bundle_path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"\0" * CABECERA.size)
+            entradas = []
+            for rfc in sorted(emisores):
+                rfc_bytes = rfc.encode("utf-8")
+                if len(rfc_bytes) > 16:
+                    raise ValueError(f"RFC demasiado largo: {rfc}")
+                cer, key, password = emisores[rfc]
+                ubicaciones = []
+                for blob in (cer, key, password.encode("utf-8")):
+                    ubicaciones.extend((f.tell(), len(blob)))
+                    f.write(blob)
+                entradas.append(ENTRADA.pack(rfc_bytes, *ubicaciones))
+
+            offset_indice = f.tell()
+            f.write(b"".join(entradas))
+            f.seek(0)
+            f.write(CABECERA.pack(MAGIC, VERSION, len(entradas), offset_indice))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, bundle_path)
+    except Exception:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def construir_bundle(cert_folder, bundle_path, actualizar=False):
+    """
+    Construye el bundle a partir de cert_folder. Con actualizar=True conserva
+    los emisores del bundle existente y sobreescribe los que estén en la carpeta.
+    Retorna el número de emisores escritos.
+    """
+    emisores = {}
+    if actualizar and Path(bundle_path).exists():
+        with KeystoreCSD(bundle_path) as keystore:
+            for rfc in keystore.rfcs():
+                emisores[rfc] = keystore.obtener(rfc)
+
+    emisores.update(leer_emisores_de_carpeta(cert_folder))
+    escribir_bundle(emisores, bundle_path)
+    print(f"✅ Bundle de CSDs escrito en {bundle_path}: {len(emisores)} emisores")
+    return len(emisores)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keystore de CSDs en un solo archivo")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    for nombre in ("construir", "actualizar"):
+        sub = comandos.add_parser(nombre)
+        sub.add_argument("cert_folder")
+        sub.add_argument("bundle")
+    listar = comandos.add_parser("listar")
+    listar.add_argument("bundle")
+    args = parser.parse_args(argv)
+
+    if args.comando == "listar":
+        with KeystoreCSD(args.bundle) as keystore:
+            for rfc in keystore.rfcs():
+                print(rfc)
+        return 0
+
+    construir_bundle(args.cert_folder, args.bundle,
+                     actualizar=args.comando == "actualizar")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,160 @@
+"""
+Perfilado muestreado del sellado (XMLProcessor.sellar_xml).
+
+Perfila 1 de cada N llamadas y, opcionalmente, solo guarda las que superan un
+umbral de latencia. Cada muestra se escribe en un directorio rotativo como:
+  - modo "cprofile": archivo .pstats (pstats / snakeviz)
+  - modo "stack":    archivo .folded con pilas colapsadas (flamegraph.pl,
+                     speedscope), tomadas por un hilo que muestrea la pila
+                     del hilo que sella; con menos overhead que cProfile
+
+El nombre de cada archivo lleva las etiquetas de la llamada: RFC, tamaño del
+documento, backend de firma y duración.
+"""
+import cProfile
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+MODOS = ("cprofile", "stack")
+
+
+class _MuestreadorPila(threading.Thread):
+    """Muestrea periódicamente la pila de un hilo y cuenta las pilas colapsadas"""
+
+    def __init__(self, hilo_ident, intervalo):
+        super().__init__(daemon=True)
+        self.hilo_ident = hilo_ident
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            frame = sys._current_frames().get(self.hilo_ident)
+            pila = []
+            while frame is not None:
+                code = frame.f_code
+                nombre = f"{Path(code.co_filename).name}:{code.co_name}"
+                # En formato colapsado ";" separa frames y " " la cuenta
+                pila.append(nombre.replace(";", "_").replace(" ", "_"))
+                frame = frame.f_back
+            if pila:
+                self.pilas[";".join(reversed(pila))] += 1
+
+    def detener(self):
+        self._detener.set()
+        self.join()
+
+
+class PerfiladorSellado:
+    def __init__(self, output_dir, muestreo_cada=100, umbral_ms=None,
+                 modo="cprofile", max_archivos=200, intervalo_muestreo=0.005):
+        """
+        muestreo_cada: perfila 1 de cada N llamadas (1 = todas)
+        umbral_ms:     si se indica, solo guarda las muestras que tardaron más.
+                       Solo filtra las llamadas ya elegidas por muestreo_cada;
+                       para capturar toda llamada lenta usa muestreo_cada=1 con
+                       modo="stack" (con "cprofile" todas pagarían su overhead)
+        modo:          "cprofile" o "stack"
+        max_archivos:  archivos que se conservan en output_dir (rotación)
+        """
+        if modo not in MODOS:
+            raise ValueError(f"Modo de perfilado inválido: {modo}")
+        if muestreo_cada < 1:
+            raise ValueError("muestreo_cada debe ser mayor o igual a 1")
+
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.muestreo_cada = muestreo_cada
+        self.umbral_ms = umbral_ms
+        self.modo = modo
+        self.max_archivos = max_archivos
+        self.intervalo_muestreo = intervalo_muestreo
+        self._contador = itertools.count()
+        self._lock = threading.Lock()
+
+    def debe_perfilar(self):
+        return next(self._contador) % self.muestreo_cada == 0
+
+    def perfilar(self, funcion, etiquetas, *args, **kwargs):
+        """
+        Ejecuta funcion(*args, **kwargs) bajo el perfilador. `etiquetas` es un
+        dict que la función puede completar durante la llamada (rfc, backend...)
+        """
+        profiler = None
+        muestreador = None
+        if self.modo == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Ya hay otro perfilador activo en este hilo
+                profiler = None
+        else:
+            muestreador = _MuestreadorPila(threading.get_ident(), self.intervalo_muestreo)
+            muestreador.start()
+
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            duracion_ms = (time.perf_counter() - inicio) * 1000
+            if profiler is not None:
+                profiler.disable()
+            if muestreador is not None:
+                muestreador.detener()
+
+            if self.umbral_ms is None or duracion_ms >= self.umbral_ms:
+                try:
+                    self._guardar(profiler, muestreador, etiquetas, duracion_ms)
+                except Exception as e:
+                    print(f"⚠️ No se pudo guardar el perfil del sellado: {e}")
+
+    def _guardar(self, profiler, muestreador, etiquetas, duracion_ms):
+        if profiler is None and muestreador is None:
+            return
+        if muestreador is not None and not muestreador.pilas:
+            # Llamada más corta que intervalo_muestreo: no hay pilas que guardar
+            return
+
+        # Un solo instante (en UTC) para que el orden de los nombres sea el
+        # cronológico que usa _rotar
+        segundos, nanos = divmod(time.time_ns(), 10**9)
+        partes = [
+            time.strftime("%Y%m%dT%H%M%S", time.gmtime(segundos)),
+            f"{nanos:09d}",
+            etiquetas.get("rfc") or "sin-rfc",
+            f"{etiquetas.get('tamano', 0)}b",
+            etiquetas.get("backend") or "sin-firma",
+            f"{duracion_ms:.0f}ms",
+        ]
+        nombre = "_".join(re.sub(r"[^A-Za-z0-9&Ñ.-]", "-", str(p)) for p in partes)
+
+        if profiler is not None:
+            ruta = self.output_dir / f"{nombre}.pstats"
+            profiler.dump_stats(str(ruta))
+        else:
+            ruta = self.output_dir / f"{nombre}.folded"
+            with open(ruta, "w", encoding="utf-8") as f:
+                for pila, cuenta in muestreador.pilas.items():
+                    f.write(f"{pila} {cuenta}\n")
+
+        self._rotar()
+        print(f"📊 Perfil de sellado guardado: {ruta}")
+
+    def _rotar(self):
+        """Elimina los archivos más antiguos si se supera max_archivos"""
+        with self._lock:
+            archivos = sorted(p for p in self.output_dir.iterdir()
+                              if p.suffix in (".pstats", ".folded"))
+            for viejo in archivos[:max(len(archivos) - self.max_archivos, 0)]:
+                try:
+                    os.unlink(viejo)
+                except OSError:
+                    pass
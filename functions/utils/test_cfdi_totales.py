@@ -0,0 +1,120 @@
+"""
+Pruebas de cfdi_totales.verificar_totales_lote.
+
+Se pueden correr con pytest o directamente: python test_cfdi_totales.py
+"""
+import copy
+from pathlib import Path
+
+from lxml import etree
+
+from cfdi_totales import verificar_totales_lote
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+XMLS_EJEMPLO = ["xml_falla_sat.xml", "xml_nuevo.xml", "xml_analizar.xml"]
+
+CFDI_BASE = """<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4"
+    xmlns:implocal="http://www.sat.gob.mx/implocal"
+    Version="4.0" Fecha="2024-01-15T10:30:00" TipoDeComprobante="I"
+    SubTotal="100.00" Total="{total}">
+  <cfdi:Conceptos>
+    <cfdi:Concepto Cantidad="1" ValorUnitario="100.00" Importe="100.00"/>
+  </cfdi:Conceptos>
+  {complemento}
+</cfdi:Comprobante>"""
+
+IMPLOCAL_RETENCION = """<cfdi:Complemento>
+    <implocal:ImpuestosLocales version="1.0" TotaldeRetenciones="2.00" TotaldeTraslados="0.00">
+      <implocal:RetencionesLocales ImpLocRetenido="ISH" TasadeRetencion="2.00" Importe="2.00"/>
+    </implocal:ImpuestosLocales>
+  </cfdi:Complemento>"""
+
+
+def _cfdi(total="100.00", complemento=""):
+    return etree.fromstring(CFDI_BASE.format(total=total, complemento=complemento))
+
+
+def _muestra():
+    return etree.parse(str(REPO_ROOT / "xml_falla_sat.xml")).getroot()
+
+
+def test_xmls_de_ejemplo_sin_errores():
+    trees = [etree.parse(str(REPO_ROOT / nombre)) for nombre in XMLS_EJEMPLO]
+    assert verificar_totales_lote(trees) == []
+
+
+def test_lote_vacio():
+    assert verificar_totales_lote([]) == []
+
+
+def test_total_y_subtotal_incorrectos():
+    total_mal = _muestra()
+    total_mal.set("Total", "1502547.10")
+    subtotal_mal = _muestra()
+    subtotal_mal.set("SubTotal", "1295300.00")
+    subtotal_mal.set("Total", "1502547.87")
+
+    fallidos = dict(verificar_totales_lote([_muestra(), total_mal, subtotal_mal]))
+    assert list(fallidos) == [1, 2]
+    assert fallidos[1][0].startswith("Total no coincide")
+    assert fallidos[2][0].startswith("SubTotal no coincide")
+
+
+def test_tolerancia_de_redondeo():
+    root = _muestra()
+    root.set("Total", "1502547.08")
+    assert verificar_totales_lote([root]) == []
+
+
+def test_traslados_no_coinciden():
+    root = _muestra()
+    impuestos = root.find("{http://www.sat.gob.mx/cfd/4}Impuestos")
+    impuestos.set("TotalImpuestosTrasladados", "207000.00")
+    fallidos = dict(verificar_totales_lote([root]))
+    assert any("TotalImpuestosTrasladados no coincide" in e for e in fallidos[0])
+
+
+def test_impuestos_locales_en_total():
+    valido = _cfdi(total="98.00", complemento=IMPLOCAL_RETENCION)
+    invalido = _cfdi(total="100.00", complemento=IMPLOCAL_RETENCION)
+    fallidos = dict(verificar_totales_lote([valido, invalido]))
+    assert list(fallidos) == [1]
+    assert fallidos[1][0].startswith("Total no coincide")
+
+
+def test_importes_invalidos_no_abortan_el_lote():
+    infinito = _muestra()
+    infinito.set("SubTotal", "Infinity")
+    desborde = _muestra()
+    desborde.set("Total", "99999999999999999999.00")
+    no_numerico = copy.deepcopy(desborde)
+    no_numerico.set("Total", "abc")
+
+    fallidos = dict(verificar_totales_lote([infinito, _muestra(), desborde, no_numerico]))
+    assert list(fallidos) == [0, 2, 3]
+    assert fallidos[0] == ["Importe no numérico: 'Infinity'"]
+    assert fallidos[2][0].startswith("Importe fuera de rango")
+    assert fallidos[3] == ["Importe no numérico: 'abc'"]
+
+
+def test_version_no_soportada():
+    cfdi33 = etree.fromstring(
+        '<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/3" '
+        'Version="3.3" SubTotal="100.00" Total="116.00"/>')
+    fallidos = dict(verificar_totales_lote([cfdi33]))
+    assert len(fallidos[0]) == 1
+    assert fallidos[0][0].startswith("Versión de CFDI no soportada")
+
+
+if __name__ == "__main__":
+    pruebas = [(nombre, prueba) for nombre, prueba in sorted(globals().items())
+               if nombre.startswith("test_")]
+    errores = 0
+    for nombre, prueba in pruebas:
+        try:
+            prueba()
+            print(f"✅ {nombre}")
+        except AssertionError as e:
+            errores += 1
+            print(f"❌ {nombre}: {e}")
+    raise SystemExit(1 if errores else 0)
@@ -0,0 +1,143 @@
+"""
+Pruebas del bundle de CSDs (keystore_csd.py) y su uso desde XMLProcessor.
+
+Se pueden correr con pytest o directamente: python test_keystore_csd.py
+"""
+import struct
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+from keystore_csd import CABECERA, ENTRADA, KeystoreCSD, construir_bundle, main
+from xml_processor import XMLProcessor
+
+RFC_ENIE = "ÑAÑ010101AB1"
+
+
+def _crear_emisor(cert_folder, rfc, cer, key, password):
+    emisor_folder = Path(cert_folder) / rfc
+    emisor_folder.mkdir(parents=True, exist_ok=True)
+    (emisor_folder / f"{rfc}.cer").write_bytes(cer)
+    (emisor_folder / f"{rfc}.key").write_bytes(key)
+    (emisor_folder / "contraseña.txt").write_bytes(password.encode("utf-8"))
+
+
+def _esperar_rechazo(bundle_path, mensaje):
+    try:
+        KeystoreCSD(bundle_path)
+    except ValueError as e:
+        assert mensaje in str(e), e
+    else:
+        raise AssertionError(f"Se esperaba ValueError para {bundle_path}")
+
+
+def test_construir_listar_obtener():
+    with tempfile.TemporaryDirectory() as tmp:
+        certs, bundle = Path(tmp) / "certs", Path(tmp) / "csd.bin"
+        _crear_emisor(certs, RFC_ENIE, b"cer-1", b"key-1", "se cret\r\n")
+        _crear_emisor(certs, "AAA010101AAA", b"cer-2", b"key-2", "otra")
+
+        assert construir_bundle(certs, bundle) == 2
+
+        salida = StringIO()
+        with redirect_stdout(salida):
+            main(["listar", str(bundle)])
+        assert salida.getvalue().split() == ["AAA010101AAA", RFC_ENIE]
+
+        with KeystoreCSD(bundle) as keystore:
+            assert len(keystore) == 2 and RFC_ENIE in keystore
+            assert keystore.obtener(RFC_ENIE) == (b"cer-1", b"key-1", "se cret")
+            assert keystore.obtener("AAA010101AAA") == (b"cer-2", b"key-2", "otra")
+            assert keystore.obtener("XXX010101XXX") is None
+
+
+def test_actualizar_conserva_y_sobreescribe():
+    with tempfile.TemporaryDirectory() as tmp:
+        certs, bundle = Path(tmp) / "certs", Path(tmp) / "csd.bin"
+        _crear_emisor(certs, "AAA010101AAA", b"cer-a", b"key-a", "a")
+        _crear_emisor(certs, "BBB010101BBB", b"cer-b", b"key-b", "b")
+        construir_bundle(certs, bundle)
+
+        nuevos = Path(tmp) / "nuevos"
+        _crear_emisor(nuevos, "BBB010101BBB", b"cer-b2", b"key-b2", "b2")
+        _crear_emisor(nuevos, "CCC010101CCC", b"cer-c", b"key-c", "c")
+        assert construir_bundle(nuevos, bundle, actualizar=True) == 3
+
+        with KeystoreCSD(bundle) as keystore:
+            assert keystore.obtener("AAA010101AAA") == (b"cer-a", b"key-a", "a")
+            assert keystore.obtener("BBB010101BBB") == (b"cer-b2", b"key-b2", "b2")
+            assert keystore.obtener("CCC010101CCC") == (b"cer-c", b"key-c", "c")
+
+
+def test_recarga_emisores_nuevos_sin_reiniciar():
+    with tempfile.TemporaryDirectory() as tmp:
+        certs, bundle = Path(tmp) / "certs", Path(tmp) / "csd.bin"
+        _crear_emisor(certs, "AAA010101AAA", b"cer-a", b"key-a", "a")
+        construir_bundle(certs, bundle)
+
+        with KeystoreCSD(bundle) as keystore:
+            _crear_emisor(certs, "BBB010101BBB", b"cer-b", b"key-b", "b")
+            construir_bundle(certs, bundle, actualizar=True)
+            assert keystore.obtener("BBB010101BBB") == (b"cer-b", b"key-b", "b")
+            assert keystore.obtener("AAA010101AAA") == (b"cer-a", b"key-a", "a")
+
+
+def test_rechaza_bundles_invalidos():
+    with tempfile.TemporaryDirectory() as tmp:
+        certs, bundle = Path(tmp) / "certs", Path(tmp) / "csd.bin"
+        _crear_emisor(certs, "AAA010101AAA", b"cer-a", b"key-a", "a")
+        construir_bundle(certs, bundle)
+        datos = bundle.read_bytes()
+
+        vacio = Path(tmp) / "vacio.bin"
+        vacio.write_bytes(b"")
+        _esperar_rechazo(vacio, "")
+
+        magic = Path(tmp) / "magic.bin"
+        magic.write_bytes(b"XXXX" + datos[4:])
+        _esperar_rechazo(magic, "inválido")
+
+        # Índice cortado: no cabe en el archivo
+        sin_indice = Path(tmp) / "sin_indice.bin"
+        sin_indice.write_bytes(datos[:-1])
+        _esperar_rechazo(sin_indice, "truncado")
+
+        # Índice completo pero con una longitud que apunta más allá de los datos
+        _, _, _, offset_indice = CABECERA.unpack_from(datos, 0)
+        entrada = list(ENTRADA.unpack_from(datos, offset_indice))
+        entrada[4] += 100
+        corrupto = Path(tmp) / "corrupto.bin"
+        corrupto.write_bytes(datos[:offset_indice] + ENTRADA.pack(*entrada))
+        _esperar_rechazo(corrupto, "truncado")
+
+
+def test_xml_processor_cierra_solo_su_keystore():
+    with tempfile.TemporaryDirectory() as tmp:
+        certs, bundle = Path(tmp) / "certs", Path(tmp) / "csd.bin"
+        _crear_emisor(certs, "AAA010101AAA", b"cer-a", b"key-a", "a")
+        construir_bundle(certs, bundle)
+
+        with XMLProcessor(keystore=bundle) as processor:
+            assert processor.cert_folder is None
+            assert processor.obtener_credenciales("AAA010101AAA") == (b"cer-a", b"key-a", "a")
+        assert processor.keystore._mm.closed
+
+        with KeystoreCSD(bundle) as keystore:
+            XMLProcessor(keystore=keystore).cerrar()
+            assert not keystore._mm.closed
+            assert keystore.obtener("AAA010101AAA") is not None
+
+
+if __name__ == "__main__":
+    pruebas = [(nombre, prueba) for nombre, prueba in sorted(globals().items())
+               if nombre.startswith("test_")]
+    errores = 0
+    for nombre, prueba in pruebas:
+        try:
+            prueba()
+            print(f"✅ {nombre}")
+        except AssertionError as e:
+            errores += 1
+            print(f"❌ {nombre}: {e}")
+    raise SystemExit(1 if errores else 0)
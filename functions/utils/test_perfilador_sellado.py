@@ -0,0 +1,103 @@
+"""
+Pruebas de perfilador_sellado.PerfiladorSellado y su uso desde XMLProcessor.
+
+Se pueden correr con pytest o directamente: python test_perfilador_sellado.py
+"""
+import pstats
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from perfilador_sellado import PerfiladorSellado
+from xml_processor import XMLProcessor
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+def _archivos(directorio):
+    return sorted(p.name for p in Path(directorio).iterdir())
+
+
+def test_muestreo_cada_n():
+    with tempfile.TemporaryDirectory() as tmp:
+        perfilador = PerfiladorSellado(tmp, muestreo_cada=3)
+        elegidas = [perfilador.debe_perfilar() for _ in range(9)]
+        assert elegidas == [True, False, False] * 3
+
+
+def test_umbral_descarta_llamadas_rapidas():
+    with tempfile.TemporaryDirectory() as tmp:
+        perfilador = PerfiladorSellado(tmp, muestreo_cada=1, umbral_ms=50)
+        assert perfilador.perfilar(lambda: "rapida", {}) == "rapida"
+        assert _archivos(tmp) == []
+
+        perfilador.perfilar(time.sleep, {}, 0.08)
+        archivos = _archivos(tmp)
+        assert len(archivos) == 1 and archivos[0].endswith(".pstats")
+        pstats.Stats(str(Path(tmp) / archivos[0]))
+
+
+def test_rotacion_conserva_los_mas_recientes():
+    with tempfile.TemporaryDirectory() as tmp:
+        perfilador = PerfiladorSellado(tmp, muestreo_cada=1, max_archivos=2)
+        escritos = []
+        for _ in range(4):
+            antes = set(_archivos(tmp))
+            perfilador.perfilar(lambda: None, {})
+            escritos.extend(set(_archivos(tmp)) - antes)
+        assert _archivos(tmp) == sorted(escritos[-2:])
+
+
+def test_modo_stack_escribe_pilas_colapsadas():
+    with tempfile.TemporaryDirectory() as tmp:
+        perfilador = PerfiladorSellado(tmp, muestreo_cada=1, modo="stack",
+                                       intervalo_muestreo=0.005)
+        perfilador.perfilar(time.sleep, {}, 0.1)
+        archivos = _archivos(tmp)
+        assert len(archivos) == 1 and archivos[0].endswith(".folded")
+
+        lineas = (Path(tmp) / archivos[0]).read_text(encoding="utf-8").splitlines()
+        assert lineas
+        for linea in lineas:
+            assert re.fullmatch(r"[^ ;]+(;[^ ;]+)* \d+", linea), linea
+
+
+def test_modo_stack_omite_llamadas_sin_muestras():
+    with tempfile.TemporaryDirectory() as tmp:
+        perfilador = PerfiladorSellado(tmp, muestreo_cada=1, modo="stack",
+                                       intervalo_muestreo=10)
+        perfilador.perfilar(lambda: None, {})
+        assert _archivos(tmp) == []
+
+
+def test_etiquetas_en_el_nombre():
+    with tempfile.TemporaryDirectory() as tmp:
+        perfiles = Path(tmp) / "perfiles"
+        xml_path = REPO_ROOT / "xml_falla_sat.xml"
+        processor = XMLProcessor(tmp, perfilador=PerfiladorSellado(perfiles, muestreo_cada=1))
+
+        def sellar_xml(xml_path):
+            processor._etiquetar(rfc="BGR190902815", backend="cryptography")
+            return "sellado"
+
+        processor._sellar_xml = sellar_xml
+        assert processor.sellar_xml(str(xml_path)) == "sellado"
+
+        archivos = _archivos(perfiles)
+        assert len(archivos) == 1
+        assert f"_BGR190902815_{xml_path.stat().st_size}b_cryptography_" in archivos[0]
+
+
+if __name__ == "__main__":
+    pruebas = [(nombre, prueba) for nombre, prueba in sorted(globals().items())
+               if nombre.startswith("test_")]
+    errores = 0
+    for nombre, prueba in pruebas:
+        try:
+            prueba()
+            print(f"✅ {nombre}")
+        except AssertionError as e:
+            errores += 1
+            print(f"❌ {nombre}: {e}")
+    raise SystemExit(1 if errores else 0)
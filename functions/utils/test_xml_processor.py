@@ -0,0 +1,58 @@
+"""
+Pruebas de XMLProcessor.sellar_lote.
+
+Se pueden correr con pytest o directamente: python test_xml_processor.py
+"""
+import tempfile
+from pathlib import Path
+
+from lxml import etree
+
+from xml_processor import XMLProcessor
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+def test_sellar_lote_solo_sella_documentos_validos():
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        bueno = tmp / "bueno.xml"
+        mal_formado = tmp / "mal_formado.xml"
+        total_mal = tmp / "total_mal.xml"
+
+        tree = etree.parse(str(REPO_ROOT / "xml_falla_sat.xml"))
+        tree.write(str(bueno))
+        tree.getroot().set("Total", "1.00")
+        tree.write(str(total_mal))
+        mal_formado.write_text("<cfdi:Comprobante", encoding="utf-8")
+
+        processor = XMLProcessor(tmp)
+        sellados = []
+
+        def sellar_tree(tree, xml_path):
+            sellados.append((xml_path, tree.getroot().get("Total")))
+            return "sellado"
+
+        processor._sellar_tree = sellar_tree
+        resultados = processor.sellar_lote([str(mal_formado), str(total_mal), str(bueno)])
+
+        assert sellados == [(str(bueno), "1502547.07")]
+        assert resultados == {
+            str(mal_formado): None,
+            str(total_mal): None,
+            str(bueno): "sellado",
+        }
+
+
+if __name__ == "__main__":
+    pruebas = [(nombre, prueba) for nombre, prueba in sorted(globals().items())
+               if nombre.startswith("test_")]
+    errores = 0
+    for nombre, prueba in pruebas:
+        try:
+            prueba()
+            print(f"✅ {nombre}")
+        except AssertionError as e:
+            errores += 1
+            print(f"❌ {nombre}: {e}")
+    raise SystemExit(1 if errores else 0)
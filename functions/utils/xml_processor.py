@@ -1,10 +1,13 @@
-mport os
+import os
 import base64
 import hashlib
 from lxml import etree
 from pathlib import Path
 import logging
 import re
+import threading
+
+from keystore_csd import KeystoreCSD
 
 # Importaciones con manejo de errores
 try:
@@ -26,19 +29,88 @@ except ImportError:
 
 
 class XMLProcessor:
-    def __init__(self, cert_folder):
-        self.cert_folder = Path(cert_folder)
+    def __init__(self, cert_folder=None, perfilador=None, keystore=None):
+        """
+        cert_folder es la carpeta cert_folder/<RFC>/.
+        keystore es un KeystoreCSD o la ruta a un bundle generado con
+        keystore_csd.py; si se pasa una ruta, el processor lo abre y lo cierra
+        en cerrar(). Un KeystoreCSD ya abierto lo sigue cerrando quien lo creó.
+        perfilador es un PerfiladorSellado opcional (perfilador_sellado.py)
+        """
+        self._keystore_propio = False
+        if keystore is not None and cert_folder is not None:
+            raise ValueError("Indica cert_folder o keystore, no ambos")
+
+        if keystore is None:
+            if cert_folder is None:
+                raise ValueError("Se requiere cert_folder o keystore")
+            if Path(cert_folder).is_file():
+                raise ValueError(
+                    f"{cert_folder} es un archivo; para un bundle de CSDs usa keystore=")
+        elif not isinstance(keystore, KeystoreCSD):
+            # Falla aquí (FileNotFoundError/ValueError) si el bundle no existe o es inválido
+            keystore = KeystoreCSD(keystore)
+            self._keystore_propio = True
+
+        self.keystore = keystore
+        self.cert_folder = Path(cert_folder) if keystore is None else None
         self.logger = logging.getLogger(__name__)
+        self.perfilador = perfilador
+        self._perfil = threading.local()
+
+    def cerrar(self):
+        """Cierra el keystore si fue abierto por este processor"""
+        if self._keystore_propio:
+            self.keystore.cerrar()
+            self._keystore_propio = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
 
     def sellar_xml(self, xml_path):
+        return self._con_perfil(xml_path, self._sellar_xml, xml_path)
+
+    def _con_perfil(self, xml_path, funcion, *args):
+        """Ejecuta funcion(*args) bajo el perfilador si esta llamada fue muestreada"""
+        if self.perfilador is None or not self.perfilador.debe_perfilar():
+            return funcion(*args)
+
         try:
-            is_valid, error = self.validate_xml(xml_path)
-            if not is_valid:
-                self.logger.error(f"❌ XML mal formado: {error}")
-                return None
+            tamano = os.path.getsize(xml_path)
+        except (OSError, TypeError):
+            tamano = 0
+        etiquetas = {"tamano": tamano}
+        self._perfil.etiquetas = etiquetas
+        try:
+            return self.perfilador.perfilar(funcion, etiquetas, *args)
+        finally:
+            self._perfil.etiquetas = None
 
+    def _etiquetar(self, **etiquetas):
+        """Agrega etiquetas al perfil de la llamada actual, si se está perfilando"""
+        actuales = getattr(self._perfil, "etiquetas", None)
+        if actuales is not None:
+            actuales.update(etiquetas)
+
+    def _sellar_xml(self, xml_path):
+        try:
             tree = etree.parse(xml_path)
+        except Exception as e:
+            self.logger.error(f"❌ XML mal formado: {e}")
+            return None
+        return self._sellar_tree(tree, xml_path)
+
+    def _sellar_tree(self, tree, xml_path):
+        """Sella un árbol ya parseado; xml_path solo se usa en los logs"""
+        try:
             root = tree.getroot()
+            is_valid, error = self._validar_root(root)
+            if not is_valid:
+                self.logger.error(f"❌ XML mal formado: {error}")
+                return None
 
             # Si ya está sellado, retornar el XML actual como está
             if self.esta_sellado(root):
@@ -51,18 +123,13 @@ class XMLProcessor:
             if not rfc:
                 self.logger.error("❌ No se pudo extraer el RFC del emisor")
                 return None
+            self._etiquetar(rfc=rfc)
 
-            emisor_folder = self.cert_folder / rfc
-            cer_path = emisor_folder / f"{rfc}.cer"
-            key_path = emisor_folder / f"{rfc}.key"
-            pass_path = emisor_folder / "contraseña.txt"
-
-            if not cer_path.exists() or not key_path.exists() or not pass_path.exists():
+            credenciales = self.obtener_credenciales(rfc)
+            if not credenciales:
                 self.logger.error(f"❌ Archivos de certificados faltantes para {rfc}")
                 return None
-
-            with open(pass_path, 'r', encoding='utf-8') as f:
-                password = f.read().rstrip('\r\n')  # Solo eliminar saltos de línea, preservar espacios
+            cer_path, key_path, password = credenciales
 
             cert, cert_b64, no_certificado = self.cargar_certificado(cer_path)
             if not cert:
@@ -119,14 +186,80 @@ class XMLProcessor:
             self.logger.error(f"❌ Error sellando XML: {e}")
             return None
 
+    def sellar_lote(self, xml_paths):
+        """
+        Sella un lote de XMLs descartando antes los que tienen errores
+        aritméticos (SubTotal, impuestos, Total) para no gastar firmas RSA en
+        documentos que el SAT va a rechazar.
+
+        Retorna un diccionario {xml_path: xml_sellado o None}.
+        """
+        from cfdi_totales import verificar_totales_lote
+
+        resultados = {}
+        legibles = []
+        trees = []
+        for xml_path in xml_paths:
+            try:
+                trees.append(etree.parse(xml_path))
+                legibles.append(xml_path)
+            except Exception as e:
+                self.logger.error(f"❌ XML mal formado {xml_path}: {e}")
+                resultados[xml_path] = None
+
+        fallidos = verificar_totales_lote(trees)
+        if fallidos is None:
+            self.logger.warning("⚠️ No se verificaron los totales del lote")
+            fallidos = []
+
+        for indice, errores in fallidos:
+            xml_path = legibles[indice]
+            for error in errores:
+                self.logger.error(f"❌ {xml_path}: {error}")
+            resultados[xml_path] = None
+
+        # Se reutiliza el árbol ya parseado para no parsear dos veces
+        for xml_path, tree in zip(legibles, trees):
+            if xml_path not in resultados:
+                resultados[xml_path] = self._con_perfil(
+                    xml_path, self._sellar_tree, tree, xml_path)
+
+        return resultados
+
+    def obtener_credenciales(self, rfc):
+        """
+        Retorna (cer, key, password) del emisor o None si faltan archivos.
+        Con keystore, cer y key son bytes; con carpeta, son rutas.
+        """
+        if self.keystore is not None:
+            return self.keystore.obtener(rfc)
+
+        emisor_folder = self.cert_folder / rfc
+        cer_path = emisor_folder / f"{rfc}.cer"
+        key_path = emisor_folder / f"{rfc}.key"
+        pass_path = emisor_folder / "contraseña.txt"
+
+        if not cer_path.exists() or not key_path.exists() or not pass_path.exists():
+            return None
+
+        with open(pass_path, 'r', encoding='utf-8') as f:
+            password = f.read().rstrip('\r\n')  # Solo eliminar saltos de línea, preservar espacios
+        return cer_path, key_path, password
+
+    def _leer_bytes(self, origen):
+        """Acepta el contenido ya cargado (keystore) o una ruta a archivo"""
+        if isinstance(origen, (bytes, bytearray)):
+            return bytes(origen)
+        with open(origen, 'rb') as f:
+            return f.read()
+
     def cargar_certificado(self, cer_path):
         """
         Carga el certificado usando múltiples métodos y extrae el número de certificado
         siguiendo la misma lógica que el código exitoso del diagnóstico
         """
         try:
-            with open(cer_path, 'rb') as cer_file:
-                cert_der = cer_file.read()
+            cert_der = self._leer_bytes(cer_path)
 
             cert = None
             cert_b64 = base64.b64encode(cert_der).decode('utf-8')
@@ -408,6 +541,7 @@ class XMLProcessor:
                 key_path, password, cadena_original)
             if sello:
                 print("✅ Firma exitosa con cryptography")
+                self._etiquetar(backend="cryptography")
                 return sello
         else:
             print("⚠️ cryptography no disponible")
@@ -419,6 +553,7 @@ class XMLProcessor:
                 key_path, password, cadena_original)
             if sello:
                 print("✅ Firma exitosa con pyOpenSSL")
+                self._etiquetar(backend="pyopenssl")
                 return sello
 
         # Método 3: Conversión con openssl command line
@@ -427,6 +562,7 @@ class XMLProcessor:
             key_path, password, cadena_original)
         if sello:
             print("✅ Firma exitosa con openssl CLI")
+            self._etiquetar(backend="openssl-cli")
             return sello
 
         print("❌ No se pudo generar el sello con ningún método")
@@ -435,8 +571,7 @@ class XMLProcessor:
     def _firmar_con_cryptography(self, key_path, password, cadena_original):
         """Firma usando cryptography library - MÉTODO PRINCIPAL"""
         try:
-            with open(key_path, 'rb') as key_file:
-                key_data = key_file.read()
+            key_data = self._leer_bytes(key_path)
 
             # Métodos de carga basados en el diagnóstico exitoso
             load_methods = [
@@ -487,8 +622,7 @@ class XMLProcessor:
                 print("❌ crypto.sign no disponible en esta versión de pyOpenSSL")
                 return None
 
-            with open(key_path, 'rb') as key_file:
-                key_data = key_file.read()
+            key_data = self._leer_bytes(key_path)
 
             # Intentar diferentes formatos de carga
             load_methods = [
@@ -544,17 +678,21 @@ class XMLProcessor:
                 temp_pem_path = temp_file.name
 
             try:
-                # Convertir DER a PEM
+                # Convertir DER a PEM (la llave del keystore se pasa por stdin)
                 cmd = [
                     'openssl', 'rsa',
-                    '-in', str(key_path),
                     '-inform', 'DER',
                     '-out', temp_pem_path,
                     '-outform', 'PEM',
                     '-passin', f'pass:{password}'
                 ]
 
-                result = subprocess.run(cmd, capture_output=True, text=True)
+                if isinstance(key_path, (bytes, bytearray)):
+                    result = subprocess.run(cmd, input=bytes(key_path),
+                                            capture_output=True)
+                else:
+                    cmd[2:2] = ['-in', str(key_path)]
+                    result = subprocess.run(cmd, capture_output=True)
 
                 if result.returncode == 0:
                     print("   ✅ Conversión DER->PEM exitosa")
@@ -595,7 +733,7 @@ class XMLProcessor:
                             print(f"   ❌ Error con pyOpenSSL: {e}")
 
                 else:
-                    print(f"   ❌ Error en conversión: {result.stderr.strip()}")
+                    print(f"   ❌ Error en conversión: {result.stderr.decode(errors='replace').strip()}")
 
             finally:
                 # Limpiar archivo temporal
@@ -619,8 +757,7 @@ class XMLProcessor:
             signature = base64.b64decode(sello)
 
             # Cargar certificado para verificación
-            with open(cer_path, 'rb') as f:
-                cert_data = f.read()
+            cert_data = self._leer_bytes(cer_path)
 
             # Método 1: Con cryptography (más confiable)
             if CRYPTOGRAPHY_AVAILABLE:
@@ -676,18 +813,20 @@ class XMLProcessor:
     def validate_xml(self, xml_path):
         try:
             tree = etree.parse(xml_path)
-            root = tree.getroot()
-            if root.tag != "{http://www.sat.gob.mx/cfd/4}Comprobante":
-                return False, "Elemento raíz incorrecto"
-            for attr in ["Version", "Fecha", "TipoDeComprobante"]:
-                if not root.get(attr):
-                    return False, f"Falta atributo: {attr}"
-            return True, None
+            return self._validar_root(tree.getroot())
         except etree.XMLSyntaxError as e:
             return False, str(e)
         except Exception as e:
             return False, f"Error general: {e}"
 
+    def _validar_root(self, root):
+        if root.tag != "{http://www.sat.gob.mx/cfd/4}Comprobante":
+            return False, "Elemento raíz incorrecto"
+        for attr in ["Version", "Fecha", "TipoDeComprobante"]:
+            if not root.get(attr):
+                return False, f"Falta atributo: {attr}"
+        return True, None
+
     def extraer_rfc_emisor(self, root):
         try:
             emisor = root.find(".//{http://www.sat.gob.mx/cfd/4}Emisor")